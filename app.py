@@ -1,17 +1,38 @@
 import os
 import time
-import pytz
-import requests
+import hashlib
+import shutil
+import orjson
+import httpx
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
+import plotly.io as pio
 from plotly.subplots import make_subplots
-from datetime import datetime, date, time as dtime, timedelta
+from datetime import datetime, time as dtime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tsdownsample import NaNMinMaxLTTBDownsampler
 from typing import Tuple, Dict, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 # Constants
 READ_TIMEOUT = 30  # seconds per request
 MAX_RETRIES = 2
+RETRY_STATUSES = (502, 503, 504)  # gateway errors worth retrying
+CGM_INTERVAL_MS = 300_000  # one sensor reading every 5 minutes
+MMOL_PER_MGDL = np.float32(1 / 18)
+ENTRY_FIELDS = ("date", "sgv")
+TREATMENT_FIELDS = ("created_at", "insulin", "carbs", "enteredBy", "eventType", "rate")
+BG_MAX_POINTS = 1000  # BG samples sent to the browser once a range gets long
+BG_DOWNSAMPLE_THRESHOLD = 1500
+SCATTERGL_MIN_POINTS = 1000
+BOLUS_BINS = 1000  # roughly the plot width in pixels
+DISK_CACHE_DIR = Path("~/.cache/adriana/v3").expanduser()  # bump when the cached frame layout changes
+DISK_CACHE_MIN_AGE_MS = 3_600_000  # only ranges that ended over an hour ago are persisted
+DISK_CACHE_TTL_S = 86_400  # re-fetch persisted ranges daily to pick up late uploads and backfill
+DISK_CACHE_MAX_ENTRIES = 64  # least recently used ranges beyond this are deleted
 
 # ────────── Nightscout Configuration ──────────
 def get_nightscout_config() -> Tuple[str, str]:
@@ -24,74 +45,205 @@ def get_nightscout_config() -> Tuple[str, str]:
         st.error(f"Missing Streamlit secret: {e}")
         st.stop()
 
+def get_local_timezone() -> ZoneInfo:
+    """Get the display timezone from Streamlit secrets or $TZ, defaulting to UTC."""
+    tz_name = st.secrets.get("LOCAL_TZ") or os.environ.get("TZ") or "UTC"
+    try:
+        return ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        st.warning(f"Unknown timezone '{tz_name}', falling back to UTC")
+        return ZoneInfo("UTC")
+
 NS_URL, NS_SECRET = get_nightscout_config()
-LOCAL_TZ = pytz.timezone(time.tzname[0]) if time.tzname else pytz.UTC
+LOCAL_TZ = get_local_timezone()
+
+# st.plotly_chart serializes through plotly.io; orjson encodes numpy arrays natively
+pio.json.config.default_engine = "orjson"
 
 # ────────── Data Fetching ──────────
-@st.cache_data(ttl=600, show_spinner=False)
-def fetch_nightscout_data(start_date: datetime, end_date: datetime) -> Tuple[pd.DataFrame, pd.DataFrame, Dict]:
-    """
-    Fetch only data needed for the selected date range with retry logic.
-    Returns: (entries_df, treatments_df, profile_dict)
-    """
-    headers = {"API-SECRET": NS_SECRET}
-    since = int(start_date.timestamp() * 1000)
-    until = int(end_date.timestamp() * 1000)
-    
-    endpoints = {
-        "entries": f"{NS_URL}/api/v1/entries.json?find[date][$gte]={since}&find[date][$lte]={until}",
-        "treatments": f"{NS_URL}/api/v1/treatments.json?find[created_at][$gte]={since}&find[created_at][$lte]={until}",
-        "profile": f"{NS_URL}/api/v1/profile.json"
-    }
+@st.cache_resource(show_spinner=False)
+def get_client(api_secret: str) -> httpx.Client:
+    """HTTP/2 Nightscout client that outlives reruns; concurrent GETs multiplex over one connection."""
+    return httpx.Client(
+        http2=True,
+        headers={"API-SECRET": api_secret},
+        timeout=httpx.Timeout(READ_TIMEOUT, connect=10),
+        limits=httpx.Limits(max_connections=8, max_keepalive_connections=4)
+    )
 
+def _get_json(client: httpx.Client, url: str):
+    """GET a Nightscout endpoint and decode the JSON body, retrying network, gateway and decode errors with backoff."""
     for attempt in range(MAX_RETRIES + 1):
+        if attempt:
+            time.sleep(0.5 * 2 ** (attempt - 1))
         try:
-            response = {
-                "entries": requests.get(endpoints["entries"], headers=headers, timeout=READ_TIMEOUT),
-                "treatments": requests.get(endpoints["treatments"], headers=headers, timeout=READ_TIMEOUT),
-                "profile": requests.get(endpoints["profile"], headers=headers, timeout=READ_TIMEOUT)
-            }
-            
-            # Validate responses
-            for key, res in response.items():
-                res.raise_for_status()
-            
-            # Process data
-            entries_df = pd.DataFrame(response["entries"].json())
-            treatments_df = pd.DataFrame(response["treatments"].json())
-            profile = response["profile"].json()[0] if response["profile"].json() else {}
-            
-            # Convert timestamps with robust column checking
-            if not entries_df.empty:
-                if "date" in entries_df.columns:
-                    entries_df["time"] = pd.to_datetime(entries_df["date"], unit="ms", utc=True)
-                elif "dateString" in entries_df.columns:
-                    entries_df["time"] = pd.to_datetime(entries_df["dateString"], utc=True)
-                else:
-                    st.warning("No timestamp column found in entries data")
-                    entries_df["time"] = pd.to_datetime("now", utc=True)
-
-            if not treatments_df.empty:
-                if "created_at" in treatments_df.columns:
-                    treatments_df["time"] = pd.to_datetime(treatments_df["created_at"], utc=True)
-                elif "timestamp" in treatments_df.columns:
-                    treatments_df["time"] = pd.to_datetime(treatments_df["timestamp"], unit="ms", utc=True)
-                else:
-                    st.warning("No timestamp column found in treatments data")
-                    treatments_df["time"] = pd.to_datetime("now", utc=True)
-            
-            return entries_df, treatments_df, profile
-            
-        except requests.exceptions.RequestException as e:
+            response = client.get(url)
+            if response.status_code in RETRY_STATUSES and attempt < MAX_RETRIES:
+                continue
+            response.raise_for_status()
+            return orjson.loads(response.content)
+        except (httpx.TransportError, orjson.JSONDecodeError):
+            # e.g. a proxy's HTML maintenance page served with 200
             if attempt == MAX_RETRIES:
-                st.error(f"Failed to fetch Nightscout data after {MAX_RETRIES} attempts: {e}")
-                st.stop()
-            st.warning(f"Nightscout request failed (attempt {attempt + 1}/{MAX_RETRIES})")
-            time.sleep(1)
+                raise
+
+def _fetch_json(urls: Dict[str, str]) -> Dict:
+    """Fetch several Nightscout endpoints concurrently, stopping the app if any of them fails."""
+    client = get_client(NS_SECRET)
+    try:
+        with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+            futures = {name: executor.submit(_get_json, client, url) for name, url in urls.items()}
+            return {name: future.result() for name, future in futures.items()}
+    except (httpx.HTTPError, orjson.JSONDecodeError) as e:
+        # 4xx responses are not retried, so the message doesn't claim retries
+        st.error(f"Failed to fetch Nightscout data: {e}")
+        st.stop()
+
+def _iso_utc(ms: int) -> str:
+    """Format epoch milliseconds the way Nightscout stores created_at."""
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+def _records_to_df(records: list, fields: Tuple[str, ...]) -> pd.DataFrame:
+    """Build a DataFrame column by column from Nightscout records, keeping only fields that occur."""
+    columns = {field: [r.get(field) for r in records] for field in fields}
+    return pd.DataFrame({
+        field: values for field, values in columns.items()
+        if any(v is not None for v in values)
+    })
+
+def _disk_cache_path(since: int, until: int) -> Optional[Path]:
+    """Directory holding the persisted frames for a closed range, or None for ranges still receiving data."""
+    if until > time.time() * 1000 - DISK_CACHE_MIN_AGE_MS:
+        return None
+    key = hashlib.sha256(f"{NS_URL}|{since}|{until}".encode()).hexdigest()
+    return DISK_CACHE_DIR / key
+
+def _read_disk_cache(cache_path: Path) -> Optional[Tuple[pd.DataFrame, pd.DataFrame]]:
+    """Load persisted frames unless missing, stale or unreadable."""
+    entries_path, treatments_path = cache_path / "entries.parquet", cache_path / "treatments.parquet"
+    try:
+        # treatments.parquet is written last, so its mtime is when the entry was completed
+        if time.time() - treatments_path.stat().st_mtime > DISK_CACHE_TTL_S:
+            return None
+        frames = pd.read_parquet(entries_path), pd.read_parquet(treatments_path)
+        os.utime(cache_path)  # The directory mtime tracks last use for pruning
+        return frames
+    except (OSError, ValueError):
+        return None  # Missing or unreadable cache: fall back to Nightscout
+
+def _write_disk_cache(cache_path: Path, entries_df: pd.DataFrame, treatments_df: pd.DataFrame):
+    """Persist frames for a closed range, then prune the least recently used ranges."""
+    try:
+        cache_path.mkdir(parents=True, exist_ok=True)
+        entries_df.to_parquet(cache_path / "entries.parquet")
+        # Written last: its presence marks a complete cache entry
+        treatments_df.to_parquet(cache_path / "treatments.parquet")
+        entries = sorted(DISK_CACHE_DIR.iterdir(), key=lambda p: p.stat().st_mtime, reverse=True)
+    except OSError:
+        return  # Read-only or full disk: the in-memory cache still applies
+    for stale in entries[DISK_CACHE_MAX_ENTRIES:]:
+        shutil.rmtree(stale, ignore_errors=True)
+
+def clear_disk_cache():
+    """Drop every persisted range, so the next fetch goes to Nightscout."""
+    shutil.rmtree(DISK_CACHE_DIR, ignore_errors=True)
+
+def _epoch_ms_to_utc(ms: pd.Series) -> pd.DatetimeIndex:
+    """Convert epoch milliseconds to UTC timestamps via an int64 nanosecond view."""
+    if not pd.api.types.is_integer_dtype(ms):
+        return pd.DatetimeIndex(pd.to_datetime(ms, unit="ms", utc=True))  # NaN-safe slow path
+    ns = np.ascontiguousarray(ms.to_numpy(dtype="int64")) * 1_000_000
+    return pd.DatetimeIndex(ns.view("datetime64[ns]")).tz_localize("UTC")
+
+def _iso_to_epoch_ms(values: pd.Series) -> np.ndarray:
+    """Parse ISO-8601 strings into int64 epoch milliseconds."""
+    return pd.DatetimeIndex(pd.to_datetime(values, utc=True, format="ISO8601")).as_unit("ms").asi8
+
+# Shared, not copied, on every hit: callers must treat the frames as read-only
+@st.cache_resource(ttl=120, max_entries=32, show_spinner=False)
+def fetch_nightscout_data(start_minute: int, end_minute: int) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Fetch only data needed for the selected date range.
+    The range is given in whole minutes since the epoch so the cache key stays stable.
+    Returns: (entries_df, treatments_df)
+    """
+    since = start_minute * 60_000
+    until = (end_minute + 1) * 60_000 - 1
+
+    # Closed ranges never change, so reuse frames persisted by an earlier run
+    cache_path = _disk_cache_path(since, until)
+    if cache_path is not None:
+        cached = _read_disk_cache(cache_path)
+        if cached is not None:
+            return cached
+    
+    # Nightscout returns only a handful of documents unless count= is given, so
+    # size it from the range: one CGM reading and up to three treatments per interval, plus slack
+    readings = (until - since) // CGM_INTERVAL_MS + 100
+    data = _fetch_json({
+        "entries": f"{NS_URL}/api/v1/entries.json"
+                   f"?find[date][$gte]={since}&find[date][$lte]={until}"
+                   f"&fields={','.join(ENTRY_FIELDS)}&count={readings}",
+        "treatments": f"{NS_URL}/api/v1/treatments.json"
+                      f"?find[created_at][$gte]={_iso_utc(since)}&find[created_at][$lte]={_iso_utc(until)}"
+                      f"&fields={','.join(TREATMENT_FIELDS)}&count={3 * readings}"
+    })
+    entries_df = _records_to_df(data["entries"], ENTRY_FIELDS)
+    treatments_df = _records_to_df(data["treatments"], TREATMENT_FIELDS)
+    
+    # Normalize timestamps to an epoch-ms "date" column; datetimes are only built
+    # in main() for the rows that survive the range filter. Entries are queried on
+    # the numeric "date", so every returned entry already carries it
+
+    # Treatments are queried on created_at, so it is always present; the ISO strings
+    # are dropped once parsed since nothing downstream reads them
+    if not treatments_df.empty:
+        treatments_df["date"] = _iso_to_epoch_ms(treatments_df.pop("created_at"))
+
+    # Sorted once here so main() can slice the range with a binary search
+    if not entries_df.empty:
+        entries_df = entries_df.sort_values("date", ignore_index=True)
+        if "sgv" in entries_df.columns:
+            # mg/dL fits int16; columns with gaps stay float
+            entries_df["sgv"] = pd.to_numeric(entries_df["sgv"], errors="coerce", downcast="integer")
+
+    if not treatments_df.empty:
+        treatments_df = treatments_df.sort_values("date", ignore_index=True)
+
+        for column in ("insulin", "carbs", "rate"):
+            if column in treatments_df.columns:
+                treatments_df[column] = pd.to_numeric(treatments_df[column], errors="coerce", downcast="float")
+
+        # Few distinct values, so classify once per category, not per row
+        for column in ("enteredBy", "eventType"):
+            if column in treatments_df.columns:
+                treatments_df[column] = treatments_df[column].astype("category")
+
+        # SMBs are told apart by uploader name; flag them here so reruns skip the lookup
+        if "enteredBy" in treatments_df.columns:
+            entered_by = treatments_df["enteredBy"]
+            categories = entered_by.cat.categories.astype(str).str.lower().to_numpy(dtype=str)
+            smb_codes = np.flatnonzero(np.char.find(categories, "smb") >= 0)
+            treatments_df["is_smb"] = np.isin(entered_by.cat.codes.to_numpy(), smb_codes)
+        else:
+            treatments_df["is_smb"] = False
+
+    # An empty result usually means the uploader was offline, so keep asking Nightscout
+    if cache_path is not None and not entries_df.empty and not treatments_df.empty:
+        _write_disk_cache(cache_path, entries_df, treatments_df)
+    
+    return entries_df, treatments_df
+
+@st.cache_data(ttl=86400, show_spinner=False)
+def fetch_profile() -> Dict:
+    """Fetch the active Nightscout profile (changes rarely, so cached for a day)."""
+    profiles = _fetch_json({"profile": f"{NS_URL}/api/v1/profile.json"})["profile"]
+    return profiles[0] if profiles else {}
 
 # ────────── Profile Processing ──────────
+@st.cache_data(show_spinner=False, max_entries=4)
 def extract_basal_segments(profile: Dict) -> Optional[pd.DataFrame]:
-    """Extract basal rate segments from Nightscout profile."""
+    """Extract basal rate segments from Nightscout profile (memoized on the profile's contents)."""
     if not profile:
         return None
         
@@ -104,40 +256,137 @@ def extract_basal_segments(profile: Dict) -> Optional[pd.DataFrame]:
     else:
         return None
 
-    return pd.DataFrame([
-        {
-            "time_offset": timedelta(seconds=int(s.get("i", s.get("timeAsSeconds", 0)))),
-            "rate": float(s.get("v", s.get("value", 0)))
-        }
-        for s in segments
-    ])
+    seconds = np.fromiter((int(s.get("i", s.get("timeAsSeconds", 0))) for s in segments), dtype="int64", count=len(segments))
+    rates = np.fromiter((float(s.get("v", s.get("value", 0))) for s in segments), dtype="float64", count=len(segments))
+    order = np.argsort(seconds, kind="stable")  # build_basal_schedule searches the offsets
+    return pd.DataFrame({
+        "time_offset": pd.to_timedelta(seconds[order], unit="s"),
+        "rate": rates[order]
+    })
 
 def build_basal_schedule(profile: Dict, start: datetime, end: datetime) -> pd.DataFrame:
     """Generate basal rate schedule for visualization."""
     segments = extract_basal_segments(profile)
-    if segments is None:
+    if segments is None or segments.empty or end <= start:
         return pd.DataFrame()
 
-    # Create schedule starting at midnight of the start date
-    midnight = start.replace(hour=0, minute=0, second=0, microsecond=0)
-    schedule = segments.copy()
-    schedule["time"] = midnight + schedule["time_offset"]
-    
-    # Add final segment and filter to date range
-    schedule = pd.concat([
-        schedule,
-        schedule.tail(1).assign(time=end + timedelta(hours=1))
-    ])
-    
-    return schedule[
-        (schedule["time"] >= start) & 
-        (schedule["time"] <= end)
-    ].reset_index(drop=True)
+    # Repeat the daily segments for every local day touching the range, starting a
+    # day early so the segment running at `start` is always found
+    first_day = start.astimezone(LOCAL_TZ).date() - timedelta(days=1)
+    n_days = (end.astimezone(LOCAL_TZ).date() - first_day).days + 1
+    if n_days <= 0:
+        return pd.DataFrame()
+    # Offsets are wall-clock times, so they are added before localizing; on DST days
+    # a time skipped by the switch moves to its end, and a repeated one takes the first pass
+    offsets = segments["time_offset"].to_numpy(dtype="timedelta64[ns]")
+    days = (np.datetime64(first_day, "D") + np.arange(n_days)).astype("datetime64[ns]")
+    wall = (days[:, None] + offsets[None, :]).ravel()
+    times = pd.DatetimeIndex(wall).tz_localize(
+        LOCAL_TZ, ambiguous=np.ones(len(wall), dtype=bool), nonexistent="shift_forward"
+    ).as_unit("ns").asi8.copy()
+    rates = np.tile(segments["rate"].to_numpy(), n_days)
+
+    # The segment already running at `start` begins at `start`
+    start_ns, end_ns = pd.Timestamp(start).value, pd.Timestamp(end).value
+    current = np.searchsorted(times, start_ns, side="right") - 1
+    if current >= 0:
+        times[current] = start_ns
+    in_range = (times >= start_ns) & (times <= end_ns)
+    times, rates = times[in_range], rates[in_range]
+    if not len(times):
+        return pd.DataFrame()
+
+    # Only rate changes are needed; the "hv" line shape draws the steps in between
+    changed = np.concatenate(([True], np.diff(rates) != 0))
+    times, rates = times[changed], rates[changed]
+
+    # Add final point so the last rate extends to the end of the range
+    times = np.append(times, end_ns)
+    rates = np.append(rates, rates[-1])
+
+    return pd.DataFrame({
+        "time": pd.to_datetime(times, utc=True),
+        "rate": rates.astype("float32")
+    })
+
+# ────────── Data Processing ──────────
+def filter_time_range(df: pd.DataFrame, start: datetime, end: datetime) -> pd.DataFrame:
+    """
+    Keep rows whose epoch-ms "date" lies within [start, end] and add their UTC "time".
+    Expects df sorted by "date", as fetch_nightscout_data returns it.
+    """
+    ms = df["date"].to_numpy()
+    lo = np.searchsorted(ms, int(start.timestamp() * 1000), side="left")
+    hi = np.searchsorted(ms, int(end.timestamp() * 1000), side="right")
+    df = df.iloc[lo:hi]
+    return df.assign(time=_epoch_ms_to_utc(df["date"]))
+
+def downsample_bg(entries_df: pd.DataFrame) -> pd.DataFrame:
+    """Reduce long BG series to BG_MAX_POINTS with MinMaxLTTB, keeping peaks and troughs."""
+    if len(entries_df) <= BG_DOWNSAMPLE_THRESHOLD:
+        return entries_df
+    if not entries_df["date"].is_monotonic_increasing:
+        entries_df = entries_df.sort_values("date")
+    idx = NaNMinMaxLTTBDownsampler().downsample(
+        entries_df["date"].to_numpy(dtype="int64"),
+        entries_df["mmol"].to_numpy(dtype="float32"),
+        n_out=BG_MAX_POINTS
+    )
+    return entries_df.iloc[idx]
+
+def bin_insulin(bolus_df: pd.DataFrame, start: datetime, end: datetime) -> pd.DataFrame:
+    """
+    Sum boluses into bins about one plot pixel wide, so long ranges draw one bar per bin.
+    Each bar sits at its bin start, keeping bars at least a bin apart; expects bolus_df sorted by "date".
+    """
+    if bolus_df.empty or "insulin" not in bolus_df.columns:
+        return bolus_df
+    bin_ms = max(60_000, int((end - start).total_seconds() * 1000) // BOLUS_BINS)
+    bins = bolus_df["date"].to_numpy(dtype="int64") // bin_ms
+    starts = np.flatnonzero(np.concatenate(([True], np.diff(bins) != 0)))
+    dates = bins[starts] * bin_ms
+    return pd.DataFrame({
+        "date": dates,
+        "time": _epoch_ms_to_utc(pd.Series(dates)),
+        "insulin": np.add.reduceat(bolus_df["insulin"].fillna(0).to_numpy(dtype="float32"), starts)
+    })
+
+def categorize_treatments(treats_df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Split treatments into bolus, SMB, manual bolus, carb and temp basal frames.
+    All masks are computed once on the underlying numpy arrays.
+    Returns: (bolus_df, smb_df, manual_df, carb_df, temp_df)
+    """
+    if treats_df.empty:
+        return (pd.DataFrame(),) * 5
+
+    n = len(treats_df)
+    no_rows = np.zeros(n, dtype=bool)
+    cols = treats_df.columns
+
+    is_bolus = treats_df["insulin"].notna().to_numpy() if "insulin" in cols else no_rows
+    is_smb = is_bolus & treats_df["is_smb"].to_numpy() if "is_smb" in cols else no_rows
+    is_manual = is_bolus & ~is_smb
+    is_carb = treats_df["carbs"].fillna(0).to_numpy() > 0 if "carbs" in cols else no_rows
+    if "eventType" in cols:
+        event_type = treats_df["eventType"].astype("category")
+        temp_codes = np.flatnonzero(event_type.cat.categories == "Temp Basal")
+        is_temp = np.isin(event_type.cat.codes.to_numpy(), temp_codes)
+    else:
+        is_temp = no_rows
+
+    return (
+        treats_df.iloc[is_bolus],
+        treats_df.iloc[is_smb],
+        treats_df.iloc[is_manual],
+        treats_df.iloc[is_carb],
+        treats_df.iloc[is_temp],
+    )
 
 # ────────── UI Components ──────────
 def setup_date_selectors() -> Tuple[datetime, datetime]:
     """Create date/time input widgets and return UTC datetimes."""
-    today = date.today()
+    today = datetime.now(LOCAL_TZ).date()  # the pickers' day, not the server's
     cols = st.columns(4)
     
     with cols[0]:
@@ -150,78 +399,48 @@ def setup_date_selectors() -> Tuple[datetime, datetime]:
         end_time = st.time_input("End time", dtime(23, 59))
     
     # Convert to timezone-aware datetimes
-    start_dt = LOCAL_TZ.localize(datetime.combine(start_date, start_time)).astimezone(pytz.UTC)
-    end_dt = LOCAL_TZ.localize(datetime.combine(end_date, end_time)).astimezone(pytz.UTC)
+    start_dt = datetime.combine(start_date, start_time, tzinfo=LOCAL_TZ).astimezone(timezone.utc)
+    end_dt = datetime.combine(end_date, end_time, tzinfo=LOCAL_TZ).astimezone(timezone.utc)
     
     return start_dt, end_dt
 
-# ────────── Main App ──────────
-def main():
-    st.set_page_config("Adriana Loop Dashboard", layout="wide")
-    st.title("Adriana's Looping Dashboard")
-    
-    # Date selection
-    start_dt, end_dt = setup_date_selectors()
-    
-    # Show loading message if fetching >1 day of data
-    if (end_dt - start_dt) > timedelta(days=1):
-        st.info("⚠️ Loading extended date range... This may take longer")
-    
-    # Data loading
-    with st.spinner("Fetching data from Nightscout..."):
-        entries_df, treats_df, profile = fetch_nightscout_data(start_dt, end_dt)
-    
-    # Filter data to selected time range with safety checks
-    if not entries_df.empty and "time" in entries_df.columns:
-        entries_df = entries_df[(entries_df["time"] >= start_dt) & (entries_df["time"] <= end_dt)]
-    else:
-        st.warning("No valid time data in entries")
-        entries_df = pd.DataFrame()
+# ────────── Visualization ──────────
+def _plot_times(df: pd.DataFrame) -> np.ndarray:
+    """
+    "time" column as LOCAL_TZ wall-clock epoch milliseconds, so the axis matches the pickers.
+    float64, which Plotly ships as a base64 typed array; int64 is sent as a plain JSON list.
+    """
+    local = df["time"].dt.tz_convert(LOCAL_TZ).dt.tz_localize(None)
+    return local.to_numpy(dtype="datetime64[ms]").view("int64").astype("float64")
 
-    if not treats_df.empty and "time" in treats_df.columns:
-        treats_df = treats_df[(treats_df["time"] >= start_dt) & (treats_df["time"] <= end_dt)]
-    else:
-        st.warning("No valid time data in treatments")
-        treats_df = pd.DataFrame()
-    
-    # Convert glucose to mmol/L if needed
-    if not entries_df.empty and "sgv" in entries_df.columns:
-        entries_df["mmol"] = (entries_df["sgv"] / 18).round(1)
-    
-    # Categorize treatments with safety checks
-    bolus_df = pd.DataFrame()
-    smb_df = pd.DataFrame()
-    manual_df = pd.DataFrame()
-    carb_df = pd.DataFrame()
-    temp_df = pd.DataFrame()
-    
-    if not treats_df.empty:
-        if "insulin" in treats_df.columns:
-            bolus_df = treats_df[treats_df["insulin"].notnull()]
-            if "enteredBy" in bolus_df.columns:
-                smb_df = bolus_df[bolus_df["enteredBy"].str.contains("smb", case=False, na=False)]
-                manual_df = bolus_df[~bolus_df["enteredBy"].str.contains("smb", case=False, na=False)]
-        
-        if "carbs" in treats_df.columns:
-            carb_df = treats_df[treats_df["carbs"].fillna(0) > 0]
-        
-        if "eventType" in treats_df.columns:
-            temp_df = treats_df[treats_df["eventType"] == "Temp Basal"]
-    
-    basal_sched_df = build_basal_schedule(profile, start_dt, end_dt)
-    
-    # Calculate dynamic display limits
-    max_bolus = bolus_df["insulin"].max() if not bolus_df.empty and "insulin" in bolus_df.columns else 0
-    bolus_ylim = max(1, max_bolus * 1.3)  # 30% padding
-    
-    # ────────── Improved Carb Visualization ──────────
+# The figure is shared between reruns, so it must not be mutated after it is built
+@st.cache_resource(show_spinner=False, max_entries=16)
+def build_figure(
+    entries_df: pd.DataFrame,
+    manual_df: pd.DataFrame,
+    smb_df: pd.DataFrame,
+    carb_df: pd.DataFrame,
+    temp_df: pd.DataFrame,
+    basal_sched_df: pd.DataFrame,
+    bolus_ylim: float
+) -> go.Figure:
+    """Build the three-panel BG / bolus & carbs / basal figure (memoized on its inputs)."""
+    # Improved carb visualization
     carb_y_pos = bolus_ylim * 0.9  # Lower position (90% of bolus range)
     if not carb_df.empty and "carbs" in carb_df.columns:
-        carb_sizes = carb_df["carbs"].fillna(0).apply(lambda g: max(8, min(g * 0.8, 35)))  # Larger bubbles
+        carb_sizes = np.clip(carb_df["carbs"].fillna(0).to_numpy(dtype="float32") * 0.8, 8.0, 35.0)  # Larger bubbles
+        carb_labels = np.char.add(np.char.mod("%d", carb_df["carbs"].to_numpy(dtype="int32")), "g")
+        minutes = _plot_times(carb_df).astype("int64") // 60_000  # local wall clock
+        clock = np.char.add(
+            np.char.zfill(((minutes // 60) % 24).astype(str), 2),
+            np.char.add(":", np.char.zfill((minutes % 60).astype(str), 2))
+        )
+        carb_hover = np.char.add(np.char.add(carb_labels, " carbs<br>"), clock)
     else:
-        carb_sizes = pd.Series([])
+        carb_sizes = np.array([], dtype="float32")
+        carb_labels = np.array([], dtype=str)
+        carb_hover = carb_labels
     
-    # ────────── Visualization ──────────
     fig = make_subplots(
         rows=3, cols=1,
         shared_xaxes=True,
@@ -229,12 +448,13 @@ def main():
         vertical_spacing=0.06
     )
     
-    # 1. Glucose Trace
+    # 1. Glucose Trace (WebGL only pays off once SVG has to draw more than ~1k points)
     if not entries_df.empty and "time" in entries_df.columns and "mmol" in entries_df.columns:
+        bg_trace = go.Scattergl if len(entries_df) > SCATTERGL_MIN_POINTS else go.Scatter
         fig.add_trace(
-            go.Scatter(
-                x=entries_df["time"],
-                y=entries_df["mmol"],
+            bg_trace(
+                x=_plot_times(entries_df),
+                y=entries_df["mmol"].to_numpy(),
                 mode="lines",
                 line=dict(color="green"),
                 name="BG",
@@ -247,8 +467,8 @@ def main():
     if not manual_df.empty and "time" in manual_df.columns and "insulin" in manual_df.columns:
         fig.add_trace(
             go.Bar(
-                x=manual_df["time"],
-                y=manual_df["insulin"],
+                x=_plot_times(manual_df),
+                y=manual_df["insulin"].to_numpy(dtype="float32"),
                 marker_color="rgba(0,102,204,0.7)",
                 name="Manual bolus"
             ),
@@ -258,8 +478,8 @@ def main():
     if not smb_df.empty and "time" in smb_df.columns and "insulin" in smb_df.columns:
         fig.add_trace(
             go.Bar(
-                x=smb_df["time"],
-                y=smb_df["insulin"],
+                x=_plot_times(smb_df),
+                y=smb_df["insulin"].to_numpy(dtype="float32"),
                 marker_color="rgba(255,99,132,0.7)",
                 name="SMB"
             ),
@@ -269,20 +489,19 @@ def main():
     if not carb_df.empty and "time" in carb_df.columns and "carbs" in carb_df.columns:
         fig.add_trace(
             go.Scatter(
-                x=carb_df["time"],
-                y=[carb_y_pos] * len(carb_df),
+                x=_plot_times(carb_df),
+                y=np.full(len(carb_df), carb_y_pos, dtype="float32"),
                 mode="markers+text",
                 marker=dict(
                     color="orange",
                     size=carb_sizes,
                     line=dict(width=1, color="darkorange")  # Border for visibility
                 ),
-                text=carb_df["carbs"].astype(int).astype(str) + "g",
+                text=carb_labels,
                 textposition="top center",
                 name="Carbs",
                 hoverinfo="text+x",
-                hovertext=carb_df["carbs"].astype(int).astype(str) + "g carbs<br>" + 
-                          carb_df["time"].dt.strftime("%H:%M")
+                hovertext=carb_hover
             ),
             row=2, col=1
         )
@@ -291,11 +510,10 @@ def main():
     if not basal_sched_df.empty and "time" in basal_sched_df.columns and "rate" in basal_sched_df.columns:
         fig.add_trace(
             go.Scatter(
-                x=basal_sched_df["time"],
-                y=basal_sched_df["rate"],
+                x=_plot_times(basal_sched_df),
+                y=basal_sched_df["rate"].to_numpy(),
                 mode="lines",
-                line_shape="hv",
-                line=dict(color="lightgrey", dash="dash"),
+                line=dict(color="lightgrey", dash="dash", shape="hv"),
                 name="Scheduled basal"
             ),
             row=3, col=1
@@ -304,15 +522,16 @@ def main():
     if not temp_df.empty and "time" in temp_df.columns and "rate" in temp_df.columns:
         fig.add_trace(
             go.Bar(
-                x=temp_df["time"],
-                y=temp_df["rate"].fillna(0),
+                x=_plot_times(temp_df),
+                y=temp_df["rate"].fillna(0).to_numpy(dtype="float32"),
                 marker_color="rgba(0,150,150,0.6)",
                 name="Temp basal"
             ),
             row=3, col=1
         )
     
-    # Axis configuration
+    # Axis configuration (x values are local wall-clock epoch ms, so the date axis type must be explicit)
+    fig.update_xaxes(type="date")
     fig.update_yaxes(title_text="mmol/L", row=1, col=1, range=[2, 15])
     fig.update_yaxes(title_text="U / g", row=2, col=1, range=[0, bolus_ylim])
     fig.update_yaxes(title_text="Basal U/h", row=3, col=1)
@@ -326,11 +545,72 @@ def main():
         hovermode="x unified"  # Better hover interactions
     )
     
+    return fig
+
+# ────────── Main App ──────────
+def main():
+    st.set_page_config("Adriana Loop Dashboard", layout="wide")
+    st.title("Adriana's Looping Dashboard")
+    
+    # Date selection
+    start_dt, end_dt = setup_date_selectors()
+    
+    # Show loading message if fetching >1 day of data
+    if (end_dt - start_dt) > timedelta(days=1):
+        st.info("⚠️ Loading extended date range... This may take longer")
+    
+    # Data loading
+    with st.spinner("Fetching data from Nightscout..."):
+        entries_df, treats_df = fetch_nightscout_data(
+            int(start_dt.timestamp()) // 60, int(end_dt.timestamp()) // 60
+        )
+        profile = fetch_profile()
+    
+    # Filter data to selected time range with safety checks
+    if not entries_df.empty and "date" in entries_df.columns:
+        entries_df = filter_time_range(entries_df, start_dt, end_dt)
+    else:
+        st.warning("No valid time data in entries")
+        entries_df = pd.DataFrame()
+
+    if not treats_df.empty and "date" in treats_df.columns:
+        treats_df = filter_time_range(treats_df, start_dt, end_dt)
+    else:
+        st.warning("No valid time data in treatments")
+        treats_df = pd.DataFrame()
+    
+    # Convert glucose to mmol/L if needed
+    if not entries_df.empty and "sgv" in entries_df.columns:
+        # float32 is ample for 0.1 mmol/L resolution and halves the payload
+        entries_df = entries_df.assign(mmol=np.round(entries_df["sgv"].to_numpy(dtype="float32") * MMOL_PER_MGDL, 1))
+        entries_df = downsample_bg(entries_df)
+    
+    # Categorize treatments in a single pass
+    _, smb_df, manual_df, carb_df, temp_df = categorize_treatments(treats_df)
+    
+    basal_sched_df = build_basal_schedule(profile, start_dt, end_dt)
+    
+    # Overlapping bars are summed at plot resolution, so the limits follow the bins
+    manual_df = bin_insulin(manual_df, start_dt, end_dt)
+    smb_df = bin_insulin(smb_df, start_dt, end_dt)
+    
+    # Calculate dynamic display limits
+    max_bolus = max(
+        (df["insulin"].max() for df in (manual_df, smb_df) if not df.empty and "insulin" in df.columns),
+        default=0
+    )
+    bolus_ylim = max(1, max_bolus * 1.3)  # 30% padding
+    
+    fig = build_figure(entries_df, manual_df, smb_df, carb_df, temp_df, basal_sched_df, bolus_ylim)
+    
     st.plotly_chart(fig, use_container_width=True)
     
-    # Add manual refresh button
+    # Add manual refresh button; only the Nightscout caches are dropped, so an
+    # unchanged payload still hits the memoized figure
     if st.button("🔄 Refresh Data"):
-        st.cache_data.clear()
+        clear_disk_cache()
+        fetch_nightscout_data.clear()
+        fetch_profile.clear()
         st.rerun()
 
 if __name__ == "__main__":